@@ -18,9 +18,16 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from .wdl_packager import package_wdl, wdl_paths
+from .cache import ImportCache
+from .git import TimestampResolver
+from .reader import PackageReader
+from .wdl_packager import package_wdl, package_wdl_async, wdl_paths
 
 __all__ = [
+    "ImportCache",
+    "PackageReader",
+    "TimestampResolver",
     "package_wdl",
+    "package_wdl_async",
     "wdl_paths"
 ]
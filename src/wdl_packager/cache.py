@@ -0,0 +1,160 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+class ImportCache:
+    """
+    A persistent cache that maps the sha256 digest of a WDL file to the URIs
+    it imports. It also records the digests of import closures (a WDL file
+    together with everything it imports) that passed type checking. The
+    cache is stored in a SQLite database so it can be shared by multiple
+    processes, for example CI jobs that share a cache volume. When the cache
+    holds more than max_entries files or closures, the least recently used
+    entries are removed.
+    """
+    def __init__(self, path: Path, max_entries: int = 10000,
+                 timeout: float = 60.0):
+        """
+        :param path: Path to the database file. It is created if it does not
+        exist.
+        :param max_entries: The maximum number of files and the maximum
+        number of closures in the cache.
+        :param timeout: How many seconds to wait for a lock held by another
+        process.
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        # A connection can not be used by multiple threads at the same time,
+        # so all use of the connection is serialized with a lock.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), timeout=timeout,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS imports ("
+                "digest TEXT PRIMARY KEY, "
+                "uris TEXT NOT NULL, "
+                "last_used REAL NOT NULL)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS checked ("
+                "digest TEXT PRIMARY KEY, "
+                "last_used REAL NOT NULL)")
+
+    def get(self, digest: str) -> Optional[List[str]]:
+        """
+        Get the import URIs for a file.
+        :param digest: The sha256 digest of the file.
+        :return: A list of import URIs, or None if the file is not cached.
+        """
+        try:
+            with self._lock, self._connection:
+                row = self._connection.execute(
+                    "SELECT uris FROM imports WHERE digest = ?",
+                    (digest,)).fetchone()
+                if row is None:
+                    return None
+                self._connection.execute(
+                    "UPDATE imports SET last_used = ? WHERE digest = ?",
+                    (time.time(), digest))
+        except sqlite3.Error as error:
+            # A cache that can not be read should not stop the packaging.
+            logging.warning(f"Could not read from import cache "
+                            f"'{self.path}': {error}")
+            return None
+        return json.loads(row[0])
+
+    def put(self, digest: str, uris: List[str]):
+        """
+        Store the import URIs for a file and evict the least recently used
+        entries if the cache is too large.
+        :param digest: The sha256 digest of the file.
+        :param uris: The URIs imported by the file.
+        """
+        try:
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO imports VALUES (?, ?, ?)",
+                    (digest, json.dumps(uris), time.time()))
+                self._evict("imports")
+        except sqlite3.Error as error:
+            logging.warning(f"Could not write to import cache "
+                            f"'{self.path}': {error}")
+
+    def is_checked(self, closure_digest: str) -> bool:
+        """
+        Check whether an import closure passed type checking.
+        :param closure_digest: The digest of the closure.
+        :return: True if the closure was recorded with set_checked.
+        """
+        try:
+            with self._lock, self._connection:
+                cursor = self._connection.execute(
+                    "UPDATE checked SET last_used = ? WHERE digest = ?",
+                    (time.time(), closure_digest))
+        except sqlite3.Error as error:
+            logging.warning(f"Could not read from import cache "
+                            f"'{self.path}': {error}")
+            return False
+        return cursor.rowcount > 0
+
+    def set_checked(self, closure_digest: str):
+        """
+        Record that an import closure passed type checking.
+        :param closure_digest: The digest of the closure.
+        """
+        try:
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO checked VALUES (?, ?)",
+                    (closure_digest, time.time()))
+                self._evict("checked")
+        except sqlite3.Error as error:
+            logging.warning(f"Could not write to import cache "
+                            f"'{self.path}': {error}")
+
+    def _evict(self, table: str):
+        self._connection.execute(
+            f"DELETE FROM {table} WHERE digest NOT IN ("
+            f"SELECT digest FROM {table} "
+            f"ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM imports").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
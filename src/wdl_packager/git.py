@@ -18,20 +18,30 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+import heapq
+import logging
+import os
 import subprocess
 from pathlib import Path
-from typing import List
+from typing import Awaitable, Dict, Iterable, List, Optional, Tuple
 
+from .utils import await_uncancellable, gather_or_cancel
 
-def git_command(repository: Path, args: List[str]) -> str:
+
+def git_command(repository: Path, args: List[str],
+                quiet: bool = False) -> str:
     """
     Run a git command in a repository. Crashes with a CalledProcessError
     :param repository: Path to the repository
     :param args: the rest of the git arguments
+    :param quiet: Do not show the error messages of git.
     :return: a string with the output
     """
     arguments = ["git", "-C", str(repository)] + args
-    results = subprocess.run(arguments, stdout=subprocess.PIPE, check=True)
+    results = subprocess.run(arguments, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL if quiet else None,
+                             check=True)
     return results.stdout.decode()
 
 
@@ -54,3 +64,385 @@ def get_commit_version(repository: Path):
     :return: A version string produced by git.
     """
     return git_command(repository, ["describe", "--always"]).strip()
+
+
+async def _kill_process(start: Awaitable[asyncio.subprocess.Process]):
+    process = await start
+    try:
+        process.kill()
+    except ProcessLookupError:  # The process has already finished.
+        pass
+    await process.wait()
+
+
+async def git_command_async(repository: Path, args: List[str],
+                            quiet: bool = False) -> str:
+    """
+    Run a git command in a repository without blocking the event loop.
+    Crashes with a CalledProcessError. The git process is killed when the
+    command is cancelled.
+    :param repository: Path to the repository
+    :param args: the rest of the git arguments
+    :param quiet: Do not show the error messages of git.
+    :return: a string with the output
+    """
+    arguments = ["git", "-C", str(repository)] + args
+    # Shield the start of the process, so a started process can always be
+    # killed.
+    start = asyncio.ensure_future(asyncio.create_subprocess_exec(
+        *arguments, stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL if quiet else None))
+    try:
+        process = await asyncio.shield(start)
+        stdout, _ = await process.communicate()
+    except asyncio.CancelledError:
+        await await_uncancellable(_kill_process(start))
+        raise
+    returncode = await process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, arguments, stdout)
+    return stdout.decode()
+
+
+async def get_commit_version_async(repository: Path):
+    """
+    Async version of get_commit_version.
+    """
+    return (await git_command_async(
+        repository, ["describe", "--always"])).strip()
+
+
+_HEAD_TIMESTAMP = ["log", "-n1", "--pretty=%at"]
+
+
+def _log_arguments(paths: Iterable[str]) -> List[str]:
+    # All commits are listed, also those that do not change the paths, with
+    # the blobs of the paths that changed. Merges are compared with each
+    # parent separately. This is enough to replay the history simplification
+    # of 'git log -n1 -- <path>' for each path separately. The log.diffMerges
+    # setting changes what -m does in git 2.31 and later, older versions
+    # ignore it. Paths in the log never start with '/', so it marks the
+    # commits.
+    return ["-c", "log.diffMerges=separate", "--literal-pathspecs", "log",
+            "--full-history", "--sparse", "--parents", "-m", "--root",
+            "--no-renames", "--raw", "--no-abbrev", "-z",
+            "--pretty=format:/%H %P %at %ct", "--"] + list(paths)
+
+
+class _History:
+    """
+    The commit graph of a repository with the changes of some paths, parsed
+    from the output of a git log with _log_arguments.
+    """
+    def __init__(self, output: str):
+        # Commit hash: (parents, author timestamp, committer timestamp)
+        self.commits = {}  # type: Dict[str, Tuple[List[str], int, int]]
+        # Commit hash: {path: blob or None if deleted}
+        self.changes = {}  # type: Dict[str, Dict[str, Optional[str]]]
+        commit = ""
+        raw = None  # type: Optional[str]
+        for token in output.split("\0"):
+            if raw is not None:
+                # A raw diff line is followed by its path.
+                blob = raw.split()[3]
+                self.changes[commit][token] = None if blob.strip("0") == "" \
+                    else blob
+                raw = None
+                continue
+            if token.startswith("/"):
+                header, _, token = token[1:].partition("\n")
+                commit, *parents, author_time, commit_time = header.split()
+                self.commits[commit] = (parents, int(author_time),
+                                        int(commit_time))
+                # A merge is listed once for each parent it differs from.
+                # The new blob of a path is the same in each diff, and a
+                # path that is in none of them is the same as in all
+                # parents.
+                self.changes.setdefault(commit, {})
+            if token.startswith(":"):
+                raw = token
+        # The log starts at HEAD, the only commit that is not a parent.
+        children = {parent for parents, _, _ in self.commits.values()
+                    for parent in parents}
+        self.heads = [commit for commit in self.commits
+                      if commit not in children]
+
+    def _blob(self, commit: str, path: str,
+              blobs: Dict[str, Optional[str]]) -> Optional[str]:
+        """
+        The blob of a path in a commit. Blobs are memoized in blobs.
+        """
+        chain = []
+        blob = None  # type: Optional[str]
+        while True:
+            if commit in blobs:
+                blob = blobs[commit]
+                break
+            chain.append(commit)
+            if path in self.changes[commit]:
+                blob = self.changes[commit][path]
+                break
+            parents = [parent for parent in self.commits[commit][0]
+                       if parent in self.commits]
+            if not parents:
+                break
+            commit = parents[0]
+        for chain_commit in chain:
+            blobs[chain_commit] = blob
+        return blob
+
+    def last_commit_timestamp(self, path: str) -> Optional[int]:
+        """
+        The author timestamp of the first commit that 'git log -- <path>'
+        shows. Like git, commits are visited newest first by committer date.
+        A commit is shown when the path differs from all its parents. At a
+        merge where the path is the same as in a parent, only the first such
+        parent is followed.
+        """
+        blobs = {}  # type: Dict[str, Optional[str]]
+        queue = [(-self.commits[head][2], number, head)
+                 for number, head in enumerate(self.heads)]
+        heapq.heapify(queue)
+        seen = set(self.heads)
+        counter = len(queue)
+        while queue:
+            _, _, commit = heapq.heappop(queue)
+            parents, author_time, _ = self.commits[commit]
+            parents = [parent for parent in parents
+                       if parent in self.commits]
+            blob = self._blob(commit, path, blobs)
+            same = [parent for parent in parents
+                    if self._blob(parent, path, blobs) == blob]
+            if not parents and blob is None:
+                continue
+            if not same:
+                return author_time
+            if same[0] not in seen:
+                seen.add(same[0])
+                heapq.heappush(queue, (-self.commits[same[0]][2], counter,
+                                       same[0]))
+                counter += 1
+        return None
+
+
+def _parse_log(output: str) -> Dict[str, int]:
+    """
+    Get the timestamp of the latest commit of each file from the output of
+    a git log with _log_arguments. The timestamp is the same as the one from
+    'git log -n1 --pretty=%at -- <path>', so it does not depend on which
+    other files are in the log.
+    :param output: The output of git log.
+    :return: A dictionary with paths relative to the repository and their
+    timestamps.
+    """
+    history = _History(output)
+    timestamps = {}  # type: Dict[str, int]
+    paths = {path for changes in history.changes.values()
+             for path in changes}
+    for path in paths:
+        timestamp = history.last_commit_timestamp(path)
+        if timestamp is not None:
+            timestamps[path] = timestamp
+    return timestamps
+
+
+class TimestampResolver:
+    """
+    Get the timestamps of the last commits of files in one git call per
+    repository. Files may be in different repositories, such as submodules.
+    The repository of each directory is looked up once and cached.
+
+    Files that are not checked in get a fallback timestamp. This is the
+    fallback_timestamp if given, otherwise the SOURCE_DATE_EPOCH environment
+    variable if set, otherwise the timestamp of the last commit of the
+    repository. Files outside a repository get the timestamp of the last
+    commit of the repository of fallback_repository instead. A ValueError is
+    raised for files outside a repository if there is no fallback_timestamp,
+    SOURCE_DATE_EPOCH or fallback_repository in a repository.
+    """
+    def __init__(self, fallback_timestamp: Optional[int] = None,
+                 fallback_repository: Optional[Path] = None):
+        """
+        :param fallback_timestamp: The timestamp for files that are not
+        checked in.
+        :param fallback_repository: A directory in the repository whose
+        last commit gives the timestamp for files outside a repository,
+        for example the directory of the main WDL file.
+        """
+        self.fallback_timestamp = fallback_timestamp
+        self.fallback_repository = fallback_repository
+        self._roots = {}  # type: Dict[Path, Optional[Path]]
+
+    def repository_root(self, directory: Path) -> Optional[Path]:
+        """
+        :param directory: A directory.
+        :return: The root of the repository of the directory, or None when
+        the directory is not in a repository.
+        """
+        if directory not in self._roots:
+            try:
+                self._roots[directory] = Path(git_command(
+                    directory, ["rev-parse", "--show-toplevel"],
+                    quiet=True).strip())
+            except subprocess.CalledProcessError:
+                self._roots[directory] = None
+        return self._roots[directory]
+
+    async def repository_root_async(self, directory: Path,
+                                    git_semaphore: asyncio.Semaphore
+                                    ) -> Optional[Path]:
+        """
+        Async version of repository_root.
+        """
+        if directory not in self._roots:
+            try:
+                async with git_semaphore:  # type: ignore
+                    output = await git_command_async(
+                        directory, ["rev-parse", "--show-toplevel"],
+                        quiet=True)
+                self._roots[directory] = Path(output.strip())
+            except subprocess.CalledProcessError:
+                self._roots[directory] = None
+        return self._roots[directory]
+
+    def _group(self, files: Iterable[Path]
+               ) -> Tuple[Dict[Path, Dict[str, Path]], List[Path]]:
+        """
+        Group files by repository. The repositories of their directories
+        must already be cached.
+        :return: A dictionary with repository roots and dictionaries with
+        paths relative to the root and the files. And a list of files that
+        are not in a repository.
+        """
+        groups = {}  # type: Dict[Path, Dict[str, Path]]
+        outside = []  # type: List[Path]
+        for file in files:
+            directory = _real_directory(file)
+            root = self._roots[directory]
+            if root is None:
+                outside.append(file)
+            else:
+                path = (directory / file.name).relative_to(root).as_posix()
+                groups.setdefault(root, {})[path] = file
+        return groups, outside
+
+    def _fallback(self) -> Optional[int]:
+        if self.fallback_timestamp is not None:
+            return self.fallback_timestamp
+        elif "SOURCE_DATE_EPOCH" in os.environ:
+            return int(os.environ["SOURCE_DATE_EPOCH"])
+        return None
+
+    def _fallback_root(self) -> Optional[Path]:
+        if self.fallback_repository is None:
+            return None
+        return self.repository_root(
+            Path(os.path.realpath(str(self.fallback_repository))))
+
+    async def _fallback_root_async(self, git_semaphore: asyncio.Semaphore
+                                   ) -> Optional[Path]:
+        if self.fallback_repository is None:
+            return None
+        return await self.repository_root_async(
+            Path(os.path.realpath(str(self.fallback_repository))),
+            git_semaphore)
+
+    @staticmethod
+    def _outside_timestamps(outside: List[Path], fallback: Optional[int]
+                            ) -> Dict[Path, int]:
+        if not outside:
+            return {}
+        if fallback is None:
+            raise ValueError(f"'{outside[0]}' is not in a git repository. "
+                             f"Set SOURCE_DATE_EPOCH to give it a "
+                             f"timestamp.")
+        return _untracked_timestamps(outside, fallback)
+
+    def timestamps(self, files: Iterable[Path]) -> Dict[Path, int]:
+        """
+        Get the unix timestamps of the last commits of files.
+        :param files: The files.
+        :return: A dictionary with the files and their timestamps.
+        """
+        files = list(files)
+        for directory in {_real_directory(file) for file in files}:
+            self.repository_root(directory)
+        groups, outside = self._group(files)
+        fallback = self._fallback()
+        if outside and fallback is None:
+            fallback_root = self._fallback_root()
+            if fallback_root is not None:
+                fallback = int(git_command(fallback_root, _HEAD_TIMESTAMP))
+        timestamps = self._outside_timestamps(outside, fallback)
+        for root, paths in groups.items():
+            logged = _parse_log(git_command(root, _log_arguments(paths)))
+            timestamps.update(_logged_timestamps(paths, logged))
+            untracked = [file for path, file in paths.items()
+                         if path not in logged]
+            if untracked:
+                fallback = self._fallback()
+                if fallback is None:
+                    fallback = int(git_command(root, _HEAD_TIMESTAMP))
+                timestamps.update(_untracked_timestamps(untracked, fallback))
+        return timestamps
+
+    async def timestamps_async(self, files: Iterable[Path],
+                               git_semaphore: asyncio.Semaphore
+                               ) -> Dict[Path, int]:
+        """
+        Async version of timestamps.
+        :param git_semaphore: Limits the number of concurrent git processes.
+        """
+        files = list(files)
+        await gather_or_cancel(*(
+            self.repository_root_async(directory, git_semaphore)
+            for directory in {_real_directory(file) for file in files}))
+
+        async def git(root: Path, args: List[str]) -> str:
+            async with git_semaphore:  # type: ignore
+                return await git_command_async(root, args)
+
+        async def repository_timestamps(root: Path, paths: Dict[str, Path]
+                                        ) -> Dict[Path, int]:
+            logged = _parse_log(await git(root, _log_arguments(paths)))
+            timestamps = _logged_timestamps(paths, logged)
+            untracked = [file for path, file in paths.items()
+                         if path not in logged]
+            if untracked:
+                fallback = self._fallback()
+                if fallback is None:
+                    fallback = int(await git(root, _HEAD_TIMESTAMP))
+                timestamps.update(_untracked_timestamps(untracked, fallback))
+            return timestamps
+
+        groups, outside = self._group(files)
+        fallback = self._fallback()
+        if outside and fallback is None:
+            fallback_root = await self._fallback_root_async(git_semaphore)
+            if fallback_root is not None:
+                fallback = int(await git(fallback_root, _HEAD_TIMESTAMP))
+        timestamps = self._outside_timestamps(outside, fallback)
+        for repository in await gather_or_cancel(*(
+                repository_timestamps(root, paths)
+                for root, paths in groups.items())):
+            timestamps.update(repository)
+        return timestamps
+
+
+def _logged_timestamps(paths: Dict[str, Path], logged: Dict[str, int]
+                       ) -> Dict[Path, int]:
+    return {file: logged[path] for path, file in paths.items()
+            if path in logged}
+
+
+def _untracked_timestamps(files: List[Path], timestamp: int
+                          ) -> Dict[Path, int]:
+    for file in files:
+        logging.warning(f"'{file}' is not checked in. Using {timestamp} as "
+                        f"its timestamp.")
+    return {file: timestamp for file in files}
+
+
+def _real_directory(file: Path) -> Path:
+    # git rev-parse --show-toplevel returns a path without symlinks.
+    return Path(os.path.realpath(str(file.parent)))
@@ -0,0 +1,187 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import json
+import mmap
+import posixpath
+import struct
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import WDL
+
+# Zip path of the index.
+INDEX = "INDEX.json"
+# The zip comment of a zip with an index is this prefix followed by the
+# offset and size of the index, separated by a colon.
+INDEX_COMMENT = b"wdl-packager-index:"
+
+_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+_END_OF_CENTRAL_DIRECTORY_SIGNATURE = b"PK\x05\x06"
+_LOCAL_FILE_HEADER = struct.Struct("<4s2B4HL2L2H")
+_LOCAL_FILE_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def index_content(zip_infos: Iterable[zipfile.ZipInfo],
+                  digests: Dict[str, str]) -> bytes:
+    """
+    Create the contents of an index.
+    :param zip_infos: The ZipInfo objects of the files in the zip.
+    :param digests: The sha256 digests of the files in the zip.
+    :return: The index contents as bytes.
+    """
+    files = {
+        zip_info.filename: {
+            "offset": zip_info.header_offset,
+            "size": zip_info.file_size,
+            "compressed_size": zip_info.compress_size,
+            "compression": zip_info.compress_type,
+            "sha256": digests[zip_info.filename]
+        } for zip_info in zip_infos
+    }
+    return json.dumps({"files": files}, sort_keys=True,
+                      separators=(",", ":")).encode()
+
+
+class PackageReader:
+    """
+    Read files from a zip that was packaged with an index. The zip is memory
+    mapped. Only the index is read when the zip is opened, files are read
+    when they are requested. This makes it quick to load a workflow from a
+    zip with many files.
+    """
+    def __init__(self, zip_path: Path):
+        """
+        :param zip_path: Path to a zip created with the index option.
+        """
+        self.path = Path(zip_path)
+        with self.path.open("rb") as zip_file:
+            # The mmap stays valid after the file is closed.
+            self._map = mmap.mmap(zip_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        try:
+            index_offset, index_size = self._index_location()
+            index = json.loads(self._read_member(
+                index_offset, zipfile.ZIP_STORED, index_size).decode())
+        except BaseException:
+            self._map.close()
+            raise
+        self._files = index["files"]  # type: Dict[str, Dict]
+
+    def _index_location(self) -> Tuple[int, int]:
+        # The end of central directory record is at the end of the zip,
+        # followed by a comment of at most 65535 bytes.
+        start = max(0, len(self._map) - _END_OF_CENTRAL_DIRECTORY.size -
+                    0xFFFF)
+        end_offset = self._map.rfind(_END_OF_CENTRAL_DIRECTORY_SIGNATURE,
+                                     start)
+        if end_offset == -1:
+            raise ValueError(f"'{self.path}' is not a zip file.")
+        comment_start = end_offset + _END_OF_CENTRAL_DIRECTORY.size
+        comment_length = _END_OF_CENTRAL_DIRECTORY.unpack_from(
+            self._map, end_offset)[-1]
+        comment = self._map[comment_start:comment_start + comment_length]
+        if not comment.startswith(INDEX_COMMENT):
+            raise ValueError(f"'{self.path}' does not have an index. Package "
+                             f"it with the index option.")
+        offset, size = comment[len(INDEX_COMMENT):].split(b":")
+        return int(offset), int(size)
+
+    def _read_member(self, offset: int, compression: int,
+                     compressed_size: int) -> bytes:
+        header = _LOCAL_FILE_HEADER.unpack_from(self._map, offset)
+        if header[0] != _LOCAL_FILE_HEADER_SIGNATURE:
+            raise ValueError(f"No file found at offset {offset} in "
+                             f"'{self.path}'.")
+        name_length, extra_length = header[10], header[11]
+        start = offset + _LOCAL_FILE_HEADER.size + name_length + extra_length
+        data = self._map[start:start + compressed_size]
+        if compression == zipfile.ZIP_STORED:
+            return data
+        elif compression == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+        raise NotImplementedError(f"Compression type {compression} is not "
+                                  f"supported.")
+
+    def paths(self) -> List[str]:
+        """
+        :return: A sorted list of the zip paths of all files in the zip.
+        """
+        return sorted(self._files)
+
+    def __contains__(self, zip_path: str) -> bool:
+        return zip_path in self._files
+
+    def read(self, zip_path: str) -> bytes:
+        """
+        Read a file from the zip and check its sha256 digest.
+        :param zip_path: The path of the file in the zip.
+        :return: The contents of the file.
+        """
+        try:
+            entry = self._files[zip_path]
+        except KeyError:
+            raise KeyError(f"'{zip_path}' is not in '{self.path}'.")
+        data = self._read_member(entry["offset"], entry["compression"],
+                                 entry["compressed_size"])
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise ValueError(f"The sha256 digest of '{zip_path}' in "
+                             f"'{self.path}' does not match the index.")
+        return data
+
+    async def read_source(self, uri: str, path: List[str],
+                          importer: Optional[WDL.Tree.Document]
+                          ) -> WDL.ReadSourceResult:
+        """
+        A read_source function for WDL.load that reads the WDL file and its
+        imports from the zip. Relative imports are resolved from the
+        importing file, the same as for files on disk.
+        """
+        if importer is None:
+            zip_path = posixpath.normpath(uri)
+        else:
+            importer_path = Path(importer.pos.abspath).relative_to(self.path)
+            zip_path = posixpath.normpath(posixpath.join(
+                posixpath.dirname(importer_path.as_posix()), uri))
+        if zip_path not in self._files:
+            raise FileNotFoundError(f"'{uri}' is not in '{self.path}'.")
+        return WDL.ReadSourceResult(
+            source_text=self.read(zip_path).decode(),
+            abspath=str(self.path / zip_path))
+
+    def load(self, uri: str) -> WDL.Tree.Document:
+        """
+        Load a WDL file and its imports from the zip.
+        :param uri: The path of the WDL file in the zip.
+        :return: The WDL document.
+        """
+        return WDL.load(uri, read_source=self.read_source)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
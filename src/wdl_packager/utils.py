@@ -18,10 +18,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+import hashlib
 import os
 import tempfile
 from pathlib import Path
-from typing import Optional
+from typing import Any, Awaitable, List, Optional
 
 
 def get_protocol(uri: str) -> Optional[str]:
@@ -65,3 +67,51 @@ def create_timestamped_temp_copy(original_file: Path, timestamp: int) -> Path:
     Path(temp_path).write_bytes(original_file.read_bytes())
     os.utime(temp_path, (timestamp, timestamp))
     return Path(temp_path)
+
+
+def file_sha256(filepath: Path) -> str:
+    """
+    Generates a sha256sum for a file. Reads file in blocks to save memory.
+    :param filepath: Path to the file
+    :return: a sha256sum as hexadecimal string.
+    """
+    hasher = hashlib.sha256()
+    with filepath.open("rb") as file_handler:
+        for block in iter(lambda: file_handler.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+async def await_uncancellable(awaitable: Awaitable):
+    """
+    Wait until an awaitable is done, also when the waiting coroutine is
+    cancelled. Used for cleaning up after a cancellation, the caller should
+    raise the CancelledError again afterwards. Exceptions of the awaitable
+    are not raised.
+    :param awaitable: A coroutine or future.
+    """
+    future = asyncio.ensure_future(awaitable)
+    while not future.done():
+        try:
+            await asyncio.wait([future])
+        except asyncio.CancelledError:
+            pass
+
+
+async def gather_or_cancel(*awaitables: Awaitable) -> List[Any]:
+    """
+    Same as asyncio.gather, but when one of the awaitables fails or the
+    coroutine is cancelled, the other awaitables are cancelled and waited
+    for before the exception is raised.
+    :param awaitables: Coroutines or futures.
+    :return: A list with the results.
+    """
+    futures = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*futures)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        await await_uncancellable(
+            asyncio.gather(*futures, return_exceptions=True))
+        raise
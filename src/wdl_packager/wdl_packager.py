@@ -19,35 +19,59 @@
 # SOFTWARE.
 
 import argparse
+import asyncio
+import hashlib
+import json
 import logging
 import os
+import shutil
+import stat
+import subprocess
+import tempfile
 import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Set, Tuple
+from typing import Callable, Dict, List, Optional, Set, Tuple, TypeVar
 
 import WDL
 
-from .git import get_commit_version, get_file_last_commit_timestamp
-from .utils import create_timestamped_temp_copy, get_protocol, \
+from .cache import ImportCache
+from .git import TimestampResolver, get_commit_version, \
+    get_commit_version_async
+from .reader import INDEX, INDEX_COMMENT, index_content
+from .utils import await_uncancellable, file_sha256, get_protocol, \
     resolve_path_naive
 from .version import get_version
 
+T = TypeVar("T")
 
-def _wdl_all_paths(wdl: WDL.Tree.Document,
-                   start_path: Path = Path()) -> List[Tuple[Path, Path]]:
+# The default maximum number of concurrent git processes of an async job.
+GIT_PROCESSES = 8
+
+# The file mode of files with git timestamps in the zip. Older versions
+# zipped temporary copies of the files, which have this mode. It is kept so
+# the zips stay the same.
+TIMESTAMPED_FILE_MODE = stat.S_IFREG | 0o600
+
+# Zip paths for the supported manifest formats.
+MANIFESTS = {
+    "sha256": "MANIFEST.sha256",
+    "json": "MANIFEST.json"
+}
+
+
+def _wdl_zip_path(uri: str, start_path: Path = Path()) -> Path:
     """
-    Return a list of all WDL files that are imported. The list contains
-    tuples of absolute path on the filesystem and relative paths from the
-    URI of the first WDL document.
-    :param wdl: The WDL document
-    :param start_path: relative path to start from.
-    :return: A list of tuple(abspath, relpath)
+    Return the path of an imported WDL file relative to the URI of the first
+    WDL document.
+    :param uri: The import URI.
+    :param start_path: The relative path of the importing document's
+    directory.
+    :return: A relative path.
     """
-    path_list = []
-
     # Only file protocol is supported
-    protocol = get_protocol(wdl.pos.uri)
+    protocol = get_protocol(uri)
     if protocol == "file":
         raise NotImplementedError("The 'file://' protocol is not usable for "
                                   "building portable WDLs. It can not be used "
@@ -55,19 +79,30 @@ def _wdl_all_paths(wdl: WDL.Tree.Document,
                                   "See: "
                                   "https://github.com/openwdl/wdl/pull/349 "
                                   "for more information.")
-    elif protocol is None:
-        uri = wdl.pos.uri
-    else:
+    elif protocol is not None:
         raise NotImplementedError(f"{protocol} is not implemented yet")
 
     try:
         # If .. is in the path we have a problem. This can be fixed by
         # resolving it.
-        wdl_path = resolve_path_naive(start_path / Path(uri))
+        return resolve_path_naive(start_path / Path(uri))
     except ValueError:
         raise ValueError(f"'..' was found in the import path "
                          f"'{uri}' and could not be resolved.")
-    path_list.append((Path(wdl.pos.abspath), wdl_path))
+
+
+def _wdl_all_paths(wdl: WDL.Tree.Document,
+                   start_path: Path = Path()) -> List[Tuple[Path, Path]]:
+    """
+    Return a list of all WDL files that are imported. The list contains
+    tuples of absolute path on the filesystem and relative paths from the
+    URI of the first WDL document.
+    :param wdl: The WDL document
+    :param start_path: relative path to start from.
+    :return: A list of tuple(abspath, relpath)
+    """
+    wdl_path = _wdl_zip_path(wdl.pos.uri, start_path)
+    path_list = [(Path(wdl.pos.abspath), wdl_path)]
 
     # Recursively use the function for imports as well.
     import_start_path = wdl_path.parent
@@ -77,16 +112,113 @@ def _wdl_all_paths(wdl: WDL.Tree.Document,
     return path_list
 
 
-def wdl_paths(wdl_uri: str) -> List[Tuple[Path, Path]]:
-    wdl_doc = WDL.load(wdl_uri)
+def _closure_digest(file_digest: str, import_digests: List[str]) -> str:
+    """
+    The digest of an import closure: a WDL file together with everything it
+    imports. Files only type check the same when all files in the closure
+    are the same.
+    :param file_digest: The sha256 digest of the WDL file.
+    :param import_digests: The closure digests of its imports, in import
+    order.
+    :return: A sha256 digest as hexadecimal string.
+    """
+    return hashlib.sha256(
+        " ".join([file_digest] + import_digests).encode()).hexdigest()
+
+
+def _cache_imports(wdl: WDL.Tree.Document, import_cache: ImportCache) -> str:
+    """
+    Store the import URIs of a loaded WDL document and its imports in the
+    cache.
+    :param wdl: The WDL document.
+    :param import_cache: The cache with import URIs.
+    :return: The closure digest of the document.
+    """
+    import_digests = [_cache_imports(wdl_import.doc, import_cache)
+                      for wdl_import in wdl.imports
+                      if wdl_import.doc is not None]
+    file_digest = file_sha256(Path(wdl.pos.abspath))
+    import_cache.put(file_digest,
+                     [wdl_import.uri for wdl_import in wdl.imports])
+    return _closure_digest(file_digest, import_digests)
+
+
+def _cached_wdl_all_paths(abspath: Path, uri: str,
+                          import_cache: ImportCache,
+                          start_path: Path = Path(),
+                          importers: Tuple[Path, ...] = ()
+                          ) -> Optional[Tuple[List[Tuple[Path, Path]], str]]:
+    """
+    Same as _wdl_all_paths, but finds the imports with an ImportCache
+    instead of a loaded WDL document.
+    :param abspath: The absolute path to the WDL file.
+    :param uri: The URI of the WDL file.
+    :param import_cache: The cache with import URIs.
+    :param start_path: relative path to start from.
+    :param importers: The absolute paths of the files that (indirectly)
+    import this file.
+    :return: A list of tuple(abspath, relpath) and the closure digest, or
+    None if any of the files is not in the cache.
+    """
+    if abspath in importers:
+        # miniwdl refuses circular imports as well.
+        cycle = " -> ".join(str(path) for path in importers + (abspath,))
+        raise ValueError(f"Circular import of '{abspath}': {cycle}")
+    wdl_path = _wdl_zip_path(uri, start_path)
+    path_list = [(abspath, wdl_path)]
+
+    file_digest = file_sha256(abspath)
+    import_uris = import_cache.get(file_digest)
+    if import_uris is None:
+        return None
+    import_start_path = wdl_path.parent
+    import_digests = []
+    for import_uri in import_uris:
+        # Imports are relative to the importing file, the same as in miniwdl.
+        import_abspath = Path(os.path.abspath(abspath.parent / import_uri))
+        imported = _cached_wdl_all_paths(
+            import_abspath, import_uri, import_cache, import_start_path,
+            importers + (abspath,))
+        if imported is None:
+            return None
+        import_paths, import_digest = imported
+        path_list.extend(import_paths)
+        import_digests.append(import_digest)
+    return path_list, _closure_digest(file_digest, import_digests)
+
+
+def wdl_paths(wdl_uri: str, import_cache: Optional[ImportCache] = None
+              ) -> List[Tuple[Path, Path]]:
+    """
+    Return a list of unique tuples of absolute paths of the WDL file and its
+    imports and their paths in the zip.
+    :param wdl_uri: The URI of the WDL file.
+    :param import_cache: Find the imports with this cache instead of loading
+    the WDL file with miniwdl. The WDL file is only not loaded when the
+    same files passed type checking together before. Otherwise it is
+    loaded and type checked and the cache is updated.
+    :return: A list of tuple(abspath, relpath)
+    """
     wdl_path = Path(wdl_uri)
+    all_paths = None  # type: Optional[List[Tuple[Path, Path]]]
+    if import_cache is not None:
+        cached = _cached_wdl_all_paths(
+            Path(os.path.abspath(wdl_uri)), wdl_uri, import_cache)
+        if cached is not None and import_cache.is_checked(cached[1]):
+            all_paths = cached[0]
+    if all_paths is None:
+        wdl = WDL.load(wdl_uri)
+        all_paths = _wdl_all_paths(wdl)
+        if import_cache is not None:
+            # The closure is only recorded after a successful load.
+            import_cache.set_checked(_cache_imports(wdl, import_cache))
 
     # Make sure the list only contains unique entries. Some WDL files import
     # the same wdl file and this wdl file will end up in the list multiple
     # times because of that. This needs to be corrected.
     unique_paths = set()  # type: Set[Path]
     unique_path_list = []
-    for source, raw_destination in _wdl_all_paths(wdl_doc):  # type: Path, Path
+    for source, raw_destination in all_paths:  # type: Path, Path
         try:
             # If we load the wdl path with WDL.load it will use the path as
             # base URI. For example /home/user/workflows/workflow.wdl. All
@@ -107,38 +239,158 @@ def wdl_paths(wdl_uri: str) -> List[Tuple[Path, Path]]:
     return unique_path_list
 
 
+def manifest_content(digests: Dict[str, str], manifest_format: str,
+                     version: Optional[str] = None) -> bytes:
+    """
+    Create the contents of a manifest file.
+    :param digests: A dictionary with zip paths and their sha256 digests.
+    :param manifest_format: 'sha256' for a file that can be checked with
+    sha256sum -c, or 'json'.
+    :param version: A version string. Added as a comment in the sha256
+    format and as the 'version' key in the json format.
+    :return: The manifest contents as bytes.
+    """
+    if manifest_format == "sha256":
+        lines = [] if version is None else [f"# version: {version}"]
+        lines.extend(f"{digests[path]}  {path}" for path in sorted(digests))
+        return ("\n".join(lines) + "\n").encode()
+    elif manifest_format == "json":
+        manifest = {"version": version, "files": digests}
+        return (json.dumps(manifest, indent=2, sort_keys=True) +
+                "\n").encode()
+    else:
+        raise ValueError(f"Unknown manifest format: '{manifest_format}'. "
+                         f"Choose one of: {', '.join(MANIFESTS)}.")
+
+
+def _check_extra_files(src_dest_list: List[Tuple[Path, Path]],
+                       manifest_format: Optional[str], index: bool):
+    zip_paths = {str(dest) for _, dest in src_dest_list}
+    if manifest_format is not None:
+        manifest_path = MANIFESTS.get(manifest_format)
+        if manifest_path is None:
+            raise ValueError(f"Unknown manifest format: '{manifest_format}'. "
+                             f"Choose one of: {', '.join(MANIFESTS)}.")
+        if manifest_path in zip_paths:
+            raise ValueError(f"'{manifest_path}' is already in the zip. "
+                             f"Can not add a manifest.")
+    if index and INDEX in zip_paths:
+        raise ValueError(f"'{INDEX}' is already in the zip. "
+                         f"Can not add an index.")
+
+
+def _set_utc_timezone():
+    if time.tzname[0] != "UTC":
+        logging.warning(f"Timezone '{time.tzname[0]}' is not 'UTC'. "
+                        f"Setting this process's timezone to 'UTC' for "
+                        f"reproducibility. Set environment variable 'TZ' "
+                        f"to 'UTC' before running this program to disable "
+                        f"this warning.")
+        os.environ["TZ"] = "UTC"
+        time.tzset()
+
+
+def _write_manifest(archive: zipfile.ZipFile, digests: Dict[str, str],
+                    manifest_format: str, version: Optional[str]
+                    ) -> Dict[str, str]:
+    """
+    Write a manifest to the zip.
+    :return: A dictionary with the manifest path and its sha256 digest.
+    """
+    # ZipInfo has a fixed default date, which keeps the manifest
+    # reproducible.
+    manifest_info = zipfile.ZipInfo(MANIFESTS[manifest_format])
+    manifest_info.external_attr = 0o644 << 16
+    content = manifest_content(digests, manifest_format, version)
+    archive.writestr(manifest_info, content)
+    return {manifest_info.filename: hashlib.sha256(content).hexdigest()}
+
+
+def _write_index(archive: zipfile.ZipFile, digests: Dict[str, str]):
+    """
+    Write an index of all files in the zip as the last file. Its offset and
+    size are stored in the zip comment, so PackageReader can find it without
+    reading the central directory.
+    :param archive: The zip file.
+    :param digests: The sha256 digests of all files in the zip.
+    """
+    index_info = zipfile.ZipInfo(INDEX)
+    index_info.external_attr = 0o644 << 16
+    archive.writestr(index_info, index_content(archive.infolist(), digests))
+    archive.comment = INDEX_COMMENT + (
+        f"{index_info.header_offset}:{index_info.compress_size}".encode())
+
+
+def _write_member(archive: zipfile.ZipFile, src: Path, dest: Path,
+                  timestamp: Optional[int] = None):
+    """
+    Write a file to the zip. This is the same as archive.write, but the
+    modification time can be given.
+    """
+    if timestamp is None:
+        archive.write(str(src), str(dest))
+        return
+    zip_info = zipfile.ZipInfo.from_file(str(src), str(dest))
+    # UTC, so the zip does not depend on the timezone of the process.
+    zip_info.date_time = time.gmtime(timestamp)[:6]
+    zip_info.external_attr = TIMESTAMPED_FILE_MODE << 16
+    zip_info.compress_type = archive.compression
+    with src.open("rb") as source, archive.open(zip_info, "w") as member:
+        shutil.copyfileobj(source, member, 1024 * 8)
+
+
 def create_zip_file(src_dest_list: List[Tuple[Path, Path]],
                     output_path: str,
-                    use_git_timestamps: bool = False):
+                    use_git_timestamps: bool = False,
+                    manifest_format: Optional[str] = None,
+                    version: Optional[str] = None,
+                    timestamp_resolver: Optional[TimestampResolver] = None,
+                    index: bool = False) -> Dict[str, str]:
+    """
+    Create a zip file and return the sha256 digests of its members.
+    :param src_dest_list: A list of tuple(source path, zip path).
+    :param output_path: The path of the zip file.
+    :param use_git_timestamps: Timestamp the files with their last git commit.
+    :param manifest_format: Add a manifest with the digests to the zip in
+    the given format. See MANIFESTS for the available formats.
+    :param version: The version to store in the manifest.
+    :param timestamp_resolver: The TimestampResolver for the git timestamps.
+    Can be used to set the timestamp of files that are not checked in.
+    :param index: Add an index for PackageReader to the zip.
+    :return: A dictionary with zip paths and their sha256 digests.
+    """
+    _check_extra_files(src_dest_list, manifest_format, index)
+    timestamps = {}  # type: Dict[Path, int]
     if use_git_timestamps:
-        if time.tzname[0] != "UTC":
-            logging.warning(f"Timezone '{time.tzname[0]}' is not 'UTC'. "
-                            f"Setting this process's timezone to 'UTC' for "
-                            f"reproducibility. Set environment variable 'TZ' "
-                            f"to 'UTC' before running this program to disable "
-                            f"this warning.")
-            os.environ["TZ"] = "UTC"
-            time.tzset()
-
-    tempfiles = []
-    with zipfile.ZipFile(output_path, "w") as archive:
-        for src, dest in src_dest_list:
-            if use_git_timestamps:
-                timestamp = get_file_last_commit_timestamp(src)
-                src_path = create_timestamped_temp_copy(src, timestamp)
-                tempfiles.append(src_path)
-            else:
-                src_path = src
-            archive.write(str(src_path), str(dest))
-    for temp in tempfiles:
-        os.remove(str(temp))
+        _set_utc_timezone()
+        if timestamp_resolver is None:
+            timestamp_resolver = TimestampResolver()
+        timestamps = timestamp_resolver.timestamps(
+            src for src, _ in src_dest_list)
 
+    with ThreadPoolExecutor() as executor:
+        # Hash the files in the background while they are written.
+        digest_futures = [(str(dest), executor.submit(file_sha256, src))
+                          for src, dest in src_dest_list]
+        with zipfile.ZipFile(output_path, "w") as archive:
+            for src, dest in src_dest_list:
+                _write_member(archive, src, dest, timestamps.get(src))
+            digests = {dest: future.result()
+                       for dest, future in digest_futures}
+            index_digests = dict(digests)
+            if manifest_format is not None:
+                index_digests.update(_write_manifest(
+                    archive, digests, manifest_format, version))
+            if index:
+                _write_index(archive, index_digests)
+    return digests
 
-def package_wdl(wdl_path: Path, output_zip: str,
-                use_git_timestamps: bool = False,
-                additional_files: Optional[List[Path]] = None):
 
-    zipfiles = wdl_paths(str(wdl_path))
+def _package_paths(wdl_path: Path,
+                   additional_files: Optional[List[Path]] = None,
+                   import_cache: Optional[ImportCache] = None
+                   ) -> List[Tuple[Path, Path]]:
+    zipfiles = wdl_paths(str(wdl_path), import_cache=import_cache)
 
     if additional_files is not None:
         for add_file in additional_files:
@@ -153,8 +405,159 @@ def package_wdl(wdl_path: Path, output_zip: str,
 
     # Sort on the zip paths for reproducibility
     zipfiles.sort(key=lambda x: str(x[1]))
-    create_zip_file(zipfiles, output_path=output_zip,
-                    use_git_timestamps=use_git_timestamps)
+    return zipfiles
+
+
+def package_wdl(wdl_path: Path, output_zip: str,
+                use_git_timestamps: bool = False,
+                additional_files: Optional[List[Path]] = None,
+                manifest_format: Optional[str] = None,
+                import_cache: Optional[ImportCache] = None,
+                timestamp_resolver: Optional[TimestampResolver] = None,
+                index: bool = False) -> Dict[str, str]:
+
+    zipfiles = _package_paths(wdl_path, additional_files, import_cache)
+    if use_git_timestamps and timestamp_resolver is None:
+        # Additional files outside git get the time of the last commit of
+        # the WDL file's repository.
+        timestamp_resolver = TimestampResolver(
+            fallback_repository=wdl_path.parent)
+
+    version = None
+    if manifest_format is not None:
+        try:
+            version = get_commit_version(wdl_path.parent)
+        except subprocess.CalledProcessError:
+            logging.warning(f"Could not determine a git version for "
+                            f"'{wdl_path}'. The manifest will not contain a "
+                            f"version.")
+    return create_zip_file(zipfiles, output_path=output_zip,
+                           use_git_timestamps=use_git_timestamps,
+                           manifest_format=manifest_format,
+                           version=version,
+                           timestamp_resolver=timestamp_resolver,
+                           index=index)
+
+
+async def _run_in_executor(function: Callable[..., T], *args) -> T:
+    """
+    Run a function in the default executor of the event loop. When the
+    coroutine is cancelled, wait for the function to finish before raising,
+    so files can be cleaned up safely.
+    """
+    future = asyncio.get_event_loop().run_in_executor(None, function, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await await_uncancellable(future)
+        raise
+
+
+async def create_zip_file_async(src_dest_list: List[Tuple[Path, Path]],
+                                output_path: str,
+                                use_git_timestamps: bool = False,
+                                manifest_format: Optional[str] = None,
+                                version: Optional[str] = None,
+                                timestamp_resolver:
+                                Optional[TimestampResolver] = None,
+                                index: bool = False,
+                                git_semaphore: Optional[asyncio.Semaphore] =
+                                None) -> Dict[str, str]:
+    """
+    Async version of create_zip_file. File reading and compression run in
+    the default executor of the event loop. The zip is written to a temporary
+    file next to output_path which is renamed when the zip is complete. When
+    the coroutine is cancelled or fails, the temporary file is removed.
+    :param git_semaphore: Limits the number of concurrent git processes.
+    Share a semaphore between jobs to limit the git processes of all jobs.
+    By default at most GIT_PROCESSES git processes are run by this job.
+    """
+    _check_extra_files(src_dest_list, manifest_format, index)
+    if use_git_timestamps:
+        if timestamp_resolver is None:
+            timestamp_resolver = TimestampResolver()
+    else:
+        # Like create_zip_file, a resolver is ignored without git timestamps.
+        timestamp_resolver = None
+    if git_semaphore is None:
+        git_semaphore = asyncio.Semaphore(GIT_PROCESSES)
+
+    loop = asyncio.get_event_loop()
+    # Hash the files in the background while they are written.
+    digest_futures = [loop.run_in_executor(None, file_sha256, src)
+                      for src, _ in src_dest_list]
+    file_descriptor, temp_output = tempfile.mkstemp(
+        suffix=".zip.part", dir=os.path.dirname(os.path.abspath(output_path)))
+    os.close(file_descriptor)
+    try:
+        timestamps = {}  # type: Dict[Path, int]
+        if timestamp_resolver is not None:
+            timestamps = await timestamp_resolver.timestamps_async(
+                (src for src, _ in src_dest_list), git_semaphore)
+        archive = zipfile.ZipFile(temp_output, "w")
+        try:
+            for src, dest in src_dest_list:
+                await _run_in_executor(_write_member, archive, src, dest,
+                                       timestamps.get(src))
+            digest_list = await asyncio.gather(*digest_futures)
+            digests = {str(dest): digest for (_, dest), digest
+                       in zip(src_dest_list, digest_list)}
+            index_digests = dict(digests)
+            if manifest_format is not None:
+                index_digests.update(await _run_in_executor(
+                    _write_manifest, archive, digests, manifest_format,
+                    version))
+            if index:
+                await _run_in_executor(_write_index, archive, index_digests)
+        finally:
+            await _run_in_executor(archive.close)
+        os.replace(temp_output, output_path)
+    except BaseException:
+        for future in digest_futures:
+            future.cancel()
+        os.remove(temp_output)
+        raise
+    return digests
+
+
+async def package_wdl_async(wdl_path: Path, output_zip: str,
+                            use_git_timestamps: bool = False,
+                            additional_files: Optional[List[Path]] = None,
+                            manifest_format: Optional[str] = None,
+                            import_cache: Optional[ImportCache] = None,
+                            timestamp_resolver:
+                            Optional[TimestampResolver] = None,
+                            index: bool = False,
+                            git_semaphore: Optional[asyncio.Semaphore] = None
+                            ) -> Dict[str, str]:
+    """
+    Async version of package_wdl that does not block the event loop. See
+    create_zip_file_async for the git_semaphore parameter.
+    """
+    zipfiles = await _run_in_executor(_package_paths, wdl_path,
+                                      additional_files, import_cache)
+    if use_git_timestamps and timestamp_resolver is None:
+        timestamp_resolver = TimestampResolver(
+            fallback_repository=wdl_path.parent)
+    if git_semaphore is None:
+        git_semaphore = asyncio.Semaphore(GIT_PROCESSES)
+
+    version = None
+    if manifest_format is not None:
+        try:
+            async with git_semaphore:  # type: ignore
+                version = await get_commit_version_async(wdl_path.parent)
+        except subprocess.CalledProcessError:
+            logging.warning(f"Could not determine a git version for "
+                            f"'{wdl_path}'. The manifest will not contain a "
+                            f"version.")
+    return await create_zip_file_async(zipfiles, output_path=output_zip,
+                                       use_git_timestamps=use_git_timestamps,
+                                       manifest_format=manifest_format,
+                                       version=version,
+                                       timestamp_resolver=timestamp_resolver,
+                                       index=index,
+                                       git_semaphore=git_semaphore)
 
 
 def argument_parser() -> argparse.ArgumentParser:
@@ -184,6 +587,25 @@ def argument_parser() -> argparse.ArgumentParser:
     parser.add_argument("--reproducible", action="store_true",
                         help="shorthand for --use-git-version-name and "
                              "--use-git-commit-timestamp")
+    parser.add_argument("--manifest", choices=list(MANIFESTS),
+                        dest="manifest_format",
+                        help="Add a manifest with the sha256 digests of all "
+                             "the files and the git version to the zip. "
+                             "'sha256' creates a MANIFEST.sha256 file that "
+                             "can be checked with 'sha256sum -c'. 'json' "
+                             "creates a MANIFEST.json file.")
+    parser.add_argument("--index", action="store_true",
+                        help="Add an INDEX.json file with the location and "
+                             "sha256 digest of each file in the zip. This "
+                             "allows wdl_packager.PackageReader to quickly "
+                             "read files from the zip.")
+    parser.add_argument("--import-cache", required=False, type=Path,
+                        help="A database file that caches the imports of "
+                             "WDL files by their contents. A WDL file is "
+                             "not loaded again when it and all its imports "
+                             "passed type checking together before. When "
+                             "any file changed, the WDL file is loaded and "
+                             "type checked as usual.")
     parser.add_argument("--version", action="version", version=get_version())
     return parser
 
@@ -205,7 +627,17 @@ def main():
         # my_workflow.zip
         output_path = wdl_path.stem + ".zip"
 
+    import_cache = None
+    if args.import_cache is not None:
+        import_cache = ImportCache(args.import_cache)
+
     package_wdl(wdl_path,
                 output_path,
                 use_git_timestamps=(args.use_timestamp or args.reproducible),
-                additional_files=args.additional_files)
+                additional_files=args.additional_files,
+                manifest_format=args.manifest_format,
+                import_cache=import_cache,
+                index=args.index)
+
+    if import_cache is not None:
+        import_cache.close()
@@ -0,0 +1,164 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import WDL
+
+import pytest
+
+from wdl_packager import ImportCache, wdl_paths
+
+from . import TEST_DATA_DIR
+
+SIMPLE_WORKFLOW = Path(TEST_DATA_DIR, "simple-workflow", "simple-workflow.wdl")
+
+
+def test_import_cache_persistent():
+    cache_file = tempfile.mktemp(".sqlite")
+    with ImportCache(Path(cache_file)) as cache:
+        assert cache.get("abc") is None
+        cache.put("abc", ["tasks/common.wdl"])
+        assert not cache.is_checked("def")
+        cache.set_checked("def")
+    with ImportCache(Path(cache_file)) as cache:
+        assert cache.get("abc") == ["tasks/common.wdl"]
+        assert cache.is_checked("def")
+    os.remove(cache_file)
+
+
+def test_import_cache_lru_eviction():
+    cache_file = tempfile.mktemp(".sqlite")
+    with ImportCache(Path(cache_file), max_entries=2) as cache:
+        cache.put("first", [])
+        cache.put("second", [])
+        # Using the first entry makes the second the least recently used.
+        cache.get("first")
+        cache.put("third", [])
+        assert len(cache) == 2
+        assert cache.get("first") == []
+        assert cache.get("second") is None
+        assert cache.get("third") == []
+    os.remove(cache_file)
+
+
+def test_import_cache_threads(caplog):
+    cache_file = tempfile.mktemp(".sqlite")
+
+    def use_cache(number: int):
+        digest = str(number % 10)
+        cache.put(digest, [digest])
+        return cache.get(digest)
+
+    with ImportCache(Path(cache_file)) as cache:
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(use_cache, range(1000)))
+        assert results == [[str(number % 10)] for number in range(1000)]
+        assert len(cache) == 10
+    # Concurrent use must not make reads or writes fail.
+    assert caplog.records == []
+    os.remove(cache_file)
+
+
+def test_wdl_paths_import_cache(monkeypatch):
+    cache_file = tempfile.mktemp(".sqlite")
+    expected = wdl_paths(str(SIMPLE_WORKFLOW))
+    with ImportCache(Path(cache_file)) as cache:
+        assert wdl_paths(str(SIMPLE_WORKFLOW), import_cache=cache) == expected
+        assert len(cache) == 3
+
+    def fail_load(*args, **kwargs):
+        raise AssertionError("cached files should not be loaded")
+
+    monkeypatch.setattr(WDL, "load", fail_load)
+    with ImportCache(Path(cache_file)) as cache:
+        assert wdl_paths(str(SIMPLE_WORKFLOW), import_cache=cache) == expected
+    os.remove(cache_file)
+
+
+def test_wdl_paths_import_cache_circular_import():
+    wdl_dir = Path(tempfile.mkdtemp())
+    (wdl_dir / "a.wdl").write_text(
+        'version 1.0\nimport "b.wdl" as b\nworkflow a {}\n')
+    (wdl_dir / "b.wdl").write_text(
+        'version 1.0\nimport "a.wdl" as a\nworkflow b {}\n')
+    cache_file = tempfile.mktemp(".sqlite")
+    with ImportCache(Path(cache_file)) as cache:
+        # miniwdl refuses the files, so they can only be in a cache that was
+        # filled by another program.
+        with pytest.raises(WDL.Error.ImportError):
+            wdl_paths(str(wdl_dir / "a.wdl"), import_cache=cache)
+        for name, uri in (("a.wdl", "b.wdl"), ("b.wdl", "a.wdl")):
+            digest = hashlib.sha256(
+                (wdl_dir / name).read_bytes()).hexdigest()
+            cache.put(digest, [uri])
+        with pytest.raises(ValueError) as e:
+            wdl_paths(str(wdl_dir / "a.wdl"), import_cache=cache)
+    e.match("Circular import")
+    shutil.rmtree(str(wdl_dir))
+    os.remove(cache_file)
+
+
+def test_wdl_paths_import_cache_type_check():
+    wdl_dir = Path(tempfile.mkdtemp())
+    wdl_file = wdl_dir / "invalid.wdl"
+    wdl_file.write_text("version 1.0\nworkflow invalid {\n"
+                        "    output {\n        Int x = unknown\n    }\n}\n")
+    cache_file = tempfile.mktemp(".sqlite")
+    with ImportCache(Path(cache_file)) as cache:
+        # Files that are not in the cache are type checked.
+        with pytest.raises(WDL.Error.UnknownIdentifier):
+            wdl_paths(str(wdl_file), import_cache=cache)
+        # Files that fail type checking are not cached.
+        assert len(cache) == 0
+    shutil.rmtree(str(wdl_dir))
+    os.remove(cache_file)
+
+
+def test_wdl_paths_import_cache_closure():
+    # Both versions of b.wdl pass type checking, but a.wdl only with the
+    # first version.
+    task_t = "version 1.0\ntask T {\n    command {}\n}\n"
+    task_u = "version 1.0\ntask U {\n    command {}\n}\n"
+    wdl_dir = Path(tempfile.mkdtemp())
+    for directory, workflow, task in (("a", "call b.T", task_t),
+                                      ("c", "call b.U", task_u)):
+        (wdl_dir / directory).mkdir()
+        (wdl_dir / directory / "b.wdl").write_text(task)
+        (wdl_dir / directory / "main.wdl").write_text(
+            f'version 1.0\nimport "b.wdl" as b\n'
+            f'workflow main {{\n    {workflow}\n}}\n')
+    cache_file = tempfile.mktemp(".sqlite")
+    with ImportCache(Path(cache_file)) as cache:
+        for directory in ("a", "c"):
+            wdl_paths(str(wdl_dir / directory / "main.wdl"),
+                      import_cache=cache)
+        (wdl_dir / "a" / "b.wdl").write_text(task_u)
+        # All files are in the cache, but they were never type checked
+        # together.
+        with pytest.raises(WDL.Error.ValidationError):
+            wdl_paths(str(wdl_dir / "a" / "main.wdl"), import_cache=cache)
+    shutil.rmtree(str(wdl_dir))
+    os.remove(cache_file)
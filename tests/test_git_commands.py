@@ -18,11 +18,19 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
 from pathlib import Path
 
 import pytest
 
-from wdl_packager.git import get_commit_version, get_file_last_commit_timestamp
+from wdl_packager import git
+from wdl_packager.git import TimestampResolver, _parse_log, \
+    get_commit_version, get_commit_version_async, \
+    get_file_last_commit_timestamp, git_command_async
 
 from . import TEST_DATA_DIR
 
@@ -42,3 +50,158 @@ def test_get_commit_timestamp(repo_file, result):
 def test_get_commit_version():
     assert get_commit_version(
         Path(TEST_DATA_DIR, "gatk-variantcalling")) == "v1.0.0-1-g43b8475"
+
+
+def test_git_commands_async():
+    repo_file = Path(TEST_DATA_DIR, "simple-workflow", "simple-workflow.wdl")
+    loop = asyncio.new_event_loop()
+    version = loop.run_until_complete(
+        get_commit_version_async(repo_file.parent))
+    loop.close()
+    assert version == get_commit_version(repo_file.parent)
+
+
+def test_git_command_async_error():
+    loop = asyncio.new_event_loop()
+    with pytest.raises(subprocess.CalledProcessError):
+        loop.run_until_complete(
+            git_command_async(TEST_DATA_DIR, ["not-a-git-command"]))
+    loop.close()
+
+
+def test_parse_log():
+    # Output of git log with _log_arguments. The merge commit on top is
+    # listed for both parents. Its a.wdl is the same as in the second parent,
+    # so the log of a.wdl follows that parent.
+    old, new, null = "1" * 40, "2" * 40, "0" * 40
+    log = (f"/m c2 s 40 40\n:100644 100644 {old} {new} M\0a.wdl\0\0"
+           f"/m c2 s 40 40\0"
+           f"/s c1 15 15\n:100644 100644 {old} {new} M\0a.wdl\0\0"
+           f"/c2 c1 20 20\n:100644 100644 {old} {new} M\0b.wdl\0"
+           f":000000 100644 {null} {new} A\0tasks/c d.wdl\0\0"
+           f"/c1  10 10\n:000000 100644 {null} {old} A\0b.wdl\0"
+           f":000000 100644 {null} {old} A\0a.wdl\0")
+    assert _parse_log(log) == {"b.wdl": 20, "tasks/c d.wdl": 20, "a.wdl": 15}
+
+
+def run_git(repository: Path, *args: str, timestamp: int = 0):
+    date = f"@{timestamp} +0000"
+    environment = dict(os.environ, GIT_AUTHOR_DATE=date,
+                       GIT_COMMITTER_DATE=date)
+    subprocess.run(["git", "-C", str(repository), "-c", "user.name=test",
+                    "-c", "user.email=test@example.com"] + list(args),
+                   env=environment, check=True)
+
+
+def commit_file(repository: Path, path: str, timestamp: int,
+                content: str = ""):
+    file = repository / path
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(content or path)
+    run_git(repository, "add", path)
+    run_git(repository, "commit", "-q", "-m", path, timestamp=timestamp)
+    return file
+
+
+@pytest.fixture()
+def repositories():
+    """A repository with a nested repository, an untracked file and a file
+    outside any repository."""
+    temp_dir = Path(tempfile.mkdtemp())
+    main = temp_dir / "main"
+    nested = main / "nested"
+    for repository in (main, nested):
+        repository.mkdir()
+        subprocess.run(["git", "init", "-q", str(repository)], check=True)
+    files = {
+        commit_file(main, "a.wdl", 1000000000): 1000000000,
+        commit_file(main, "tasks/b c.wdl", 1100000000): 1100000000,
+        commit_file(nested, "d.wdl", 1200000000): 1200000000,
+    }
+    untracked = main / "tasks" / "untracked.wdl"
+    untracked.write_text("untracked")
+    outside = temp_dir / "outside.wdl"
+    outside.write_text("outside")
+    yield files, untracked, outside
+    shutil.rmtree(str(temp_dir))
+
+
+def test_timestamp_resolver(repositories, monkeypatch):
+    files, untracked, outside = repositories
+    git_calls = []
+    git_command = git.git_command
+
+    def counting_git_command(repository, args, **kwargs):
+        git_calls.append(args)
+        return git_command(repository, args, **kwargs)
+
+    monkeypatch.setattr(git, "git_command", counting_git_command)
+    resolver = TimestampResolver(fallback_timestamp=42)
+    timestamps = resolver.timestamps(list(files) + [untracked, outside])
+    assert timestamps == {**files, untracked: 42, outside: 42}
+    # One log per repository and one rev-parse per directory.
+    assert len([args for args in git_calls if "log" in args]) == 2
+    assert len([args for args in git_calls if "rev-parse" in args]) == 4
+    # The repositories are cached.
+    git_calls.clear()
+    resolver.timestamps(files)
+    assert len(git_calls) == 2
+
+
+def test_timestamp_resolver_merge():
+    # a.wdl gets the same change on both branches, b.wdl only on the side
+    # branch. The log of a.wdl follows the first parent of the merge, so its
+    # last commit is the one on the main branch.
+    repository = Path(tempfile.mkdtemp())
+    run_git(repository, "init", "-q")
+    run_git(repository, "checkout", "-q", "-b", "main")
+    commit_file(repository, "a.wdl", 100)
+    commit_file(repository, "b.wdl", 100)
+    run_git(repository, "checkout", "-q", "-b", "side")
+    commit_file(repository, "a.wdl", 300, content="changed")
+    commit_file(repository, "b.wdl", 300, content="changed")
+    run_git(repository, "checkout", "-q", "main")
+    commit_file(repository, "a.wdl", 200, content="changed")
+    run_git(repository, "merge", "-q", "--no-edit", "side", timestamp=400)
+    files = [repository / "a.wdl", repository / "b.wdl"]
+    try:
+        timestamps = TimestampResolver().timestamps(files)
+        assert timestamps == {
+            file: get_file_last_commit_timestamp(file) for file in files}
+        assert timestamps == {files[0]: 200, files[1]: 300}
+    finally:
+        shutil.rmtree(str(repository))
+
+
+def test_timestamp_resolver_fallback(repositories, monkeypatch):
+    files, untracked, outside = repositories
+    monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+    # Untracked files get the timestamp of the last commit.
+    assert TimestampResolver().timestamps([untracked]) == {
+        untracked: 1100000000}
+    with pytest.raises(ValueError) as e:
+        TimestampResolver().timestamps([outside])
+    assert e.match("is not in a git repository")
+    # Files outside a repository can get the timestamp of the last commit of
+    # another repository.
+    nested = untracked.parent.parent / "nested"
+    resolver = TimestampResolver(fallback_repository=nested)
+    assert resolver.timestamps([outside]) == {outside: 1200000000}
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(resolver.timestamps_async(
+        [outside], asyncio.Semaphore(1))) == {outside: 1200000000}
+    loop.close()
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "7")
+    assert TimestampResolver().timestamps([untracked, outside]) == {
+        untracked: 7, outside: 7}
+
+
+def test_timestamp_resolver_async(repositories):
+    files, untracked, outside = repositories
+    all_files = list(files) + [untracked, outside]
+    resolver = TimestampResolver(fallback_timestamp=42)
+    loop = asyncio.new_event_loop()
+    timestamps = loop.run_until_complete(
+        resolver.timestamps_async(all_files, asyncio.Semaphore(2)))
+    loop.close()
+    assert timestamps == TimestampResolver(42).timestamps(all_files)
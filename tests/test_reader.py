@@ -0,0 +1,90 @@
+# Copyright (c) 2019 Leiden University Medical Center
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import hashlib
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from wdl_packager import PackageReader, package_wdl
+from wdl_packager.reader import INDEX
+from wdl_packager.wdl_packager import _write_index
+
+from . import TEST_DATA_DIR
+
+SIMPLE_WORKFLOW = Path(TEST_DATA_DIR, "simple-workflow", "simple-workflow.wdl")
+
+
+def test_package_reader():
+    test_zip = tempfile.mktemp(".zip")
+    digests = package_wdl(SIMPLE_WORKFLOW, test_zip, manifest_format="json",
+                          index=True)
+    with zipfile.ZipFile(test_zip, "r") as wdl_zip:
+        assert wdl_zip.testzip() is None
+        assert wdl_zip.namelist()[-1] == INDEX
+        expected = {name: wdl_zip.read(name) for name in wdl_zip.namelist()
+                    if name != INDEX}
+    with PackageReader(Path(test_zip)) as reader:
+        assert reader.paths() == sorted(expected)
+        for zip_path, contents in expected.items():
+            assert reader.read(zip_path) == contents
+        assert "tasks/echo.wdl" in reader
+        assert "tasks/missing.wdl" not in reader
+        with pytest.raises(KeyError):
+            reader.read("tasks/missing.wdl")
+    assert set(digests) < set(expected)
+    os.remove(test_zip)
+
+
+def test_package_reader_load():
+    test_zip = tempfile.mktemp(".zip")
+    package_wdl(SIMPLE_WORKFLOW, test_zip, index=True)
+    with PackageReader(Path(test_zip)) as reader:
+        document = reader.load("simple-workflow.wdl")
+    assert document.workflow.name == "SimpleWorkflow"
+    imported = {wdl_import.doc.pos.abspath for wdl_import in document.imports}
+    assert imported == {str(Path(test_zip, "tasks", "common.wdl")),
+                        str(Path(test_zip, "tasks", "echo.wdl"))}
+    os.remove(test_zip)
+
+
+def test_package_reader_deflated():
+    test_zip = tempfile.mktemp(".zip")
+    contents = b"version 1.0\n" * 1000
+    with zipfile.ZipFile(test_zip, "w",
+                         compression=zipfile.ZIP_DEFLATED) as wdl_zip:
+        wdl_zip.writestr("tasks/large.wdl", contents)
+        _write_index(wdl_zip, {
+            "tasks/large.wdl": hashlib.sha256(contents).hexdigest()})
+    with PackageReader(Path(test_zip)) as reader:
+        assert reader.read("tasks/large.wdl") == contents
+    os.remove(test_zip)
+
+
+def test_package_reader_no_index():
+    test_zip = tempfile.mktemp(".zip")
+    package_wdl(SIMPLE_WORKFLOW, test_zip)
+    with pytest.raises(ValueError) as e:
+        PackageReader(Path(test_zip))
+    assert e.match("does not have an index")
+    os.remove(test_zip)
@@ -18,14 +18,17 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+import hashlib
 import os
 import tempfile
 from pathlib import Path
 
 import pytest
 
-from wdl_packager.utils import create_timestamped_temp_copy, \
-    get_protocol, resolve_path_naive
+from wdl_packager.utils import await_uncancellable, \
+    create_timestamped_temp_copy, file_sha256, get_protocol, \
+    resolve_path_naive
 
 PROTOCOL_TEST = [
     ("/bla/bla/bladiebla", None),
@@ -74,3 +77,39 @@ def test_create_timestamped_tempfile():
     assert timestamped_copy.stat().st_mtime == timestamp
     os.remove(temp_file)
     os.remove(str(timestamped_copy))
+
+
+def test_file_sha256():
+    temp_handle, temp_file = tempfile.mkstemp()
+    contents = b"version 1.0\n" * 200000
+    Path(temp_file).write_bytes(contents)
+    assert file_sha256(Path(temp_file)) == hashlib.sha256(contents).hexdigest()
+    os.remove(temp_file)
+
+
+def test_await_uncancellable():
+    async def cleanup(steps):
+        await asyncio.sleep(0.01)
+        steps.append("cleaned up")
+
+    async def cancelled_job(steps):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            await await_uncancellable(cleanup(steps))
+            raise
+
+    async def cancel_twice():
+        steps = []  # type: ignore
+        task = asyncio.ensure_future(cancelled_job(steps))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return steps
+
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(cancel_twice()) == ["cleaned up"]
+    loop.close()
@@ -18,7 +18,11 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+import hashlib
+import json
 import os
+import subprocess
 import sys
 import tempfile
 import time
@@ -28,11 +32,15 @@ from pathlib import Path
 import pytest
 
 from wdl_packager import (package_wdl,
+                          package_wdl_async,
                           wdl_packager,
                           wdl_paths, )
+from wdl_packager.git import TimestampResolver
 
 from . import TEST_DATA_DIR, file_md5sum
 
+SIMPLE_WORKFLOW = Path(TEST_DATA_DIR, "simple-workflow", "simple-workflow.wdl")
+
 
 def test_wdl_paths():
     wdl_file = TEST_DATA_DIR / Path("gatk-variantcalling",
@@ -142,3 +150,157 @@ def test_timezone_check(caplog):
         caplog.messages))
     assert len(warnings) == 1
     os.remove(test_zip)
+
+
+def test_package_wdl_additional_file_outside_git(monkeypatch):
+    monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+    additional_file = Path(tempfile.mktemp(".txt"))
+    additional_file.write_text("outside")
+    test_zip = tempfile.mktemp(".zip")
+    package_wdl(SIMPLE_WORKFLOW, test_zip, use_git_timestamps=True,
+                additional_files=[additional_file])
+    # The file gets the time of the last commit of the WDL file's repository.
+    head_timestamp = int(subprocess.run(
+        ["git", "-C", str(SIMPLE_WORKFLOW.parent), "log", "-n1",
+         "--pretty=%at"], stdout=subprocess.PIPE, check=True).stdout)
+    with zipfile.ZipFile(test_zip, "r") as wdl_zip:
+        zip_info = wdl_zip.getinfo(additional_file.name)
+        assert zip_info.external_attr >> 16 == \
+            wdl_packager.TIMESTAMPED_FILE_MODE
+        # Zip timestamps have a resolution of two seconds.
+        assert zip_info.date_time == time.gmtime(
+            head_timestamp - head_timestamp % 2)[:6]
+    os.remove(test_zip)
+    additional_file.unlink()
+
+
+@pytest.mark.parametrize("manifest_format", ["sha256", "json"])
+def test_package_wdl_manifest(manifest_format):
+    test_zip = tempfile.mktemp(".zip")
+    digests = package_wdl(SIMPLE_WORKFLOW, test_zip,
+                          manifest_format=manifest_format)
+    assert set(digests) == {"simple-workflow.wdl", "tasks/common.wdl",
+                            "tasks/echo.wdl"}
+    manifest_path = wdl_packager.MANIFESTS[manifest_format]
+    with zipfile.ZipFile(test_zip, "r") as wdl_zip:
+        zipped_files = [zip_info.filename for zip_info in wdl_zip.filelist]
+        assert zipped_files[-1] == manifest_path
+        manifest = wdl_zip.read(manifest_path).decode()
+        for path, digest in digests.items():
+            assert digest == hashlib.sha256(wdl_zip.read(path)).hexdigest()
+    if manifest_format == "json":
+        assert json.loads(manifest)["files"] == digests
+        assert "version" in json.loads(manifest)
+    else:
+        lines = [line for line in manifest.splitlines()
+                 if not line.startswith("#")]
+        assert lines == [f"{digests[path]}  {path}"
+                         for path in sorted(digests)]
+    os.remove(test_zip)
+
+
+def test_package_wdl_unknown_manifest():
+    test_zip = tempfile.mktemp(".zip")
+    with pytest.raises(ValueError) as e:
+        package_wdl(SIMPLE_WORKFLOW, test_zip, manifest_format="md5")
+    assert e.match("Unknown manifest format")
+    assert not Path(test_zip).exists()
+
+
+@pytest.mark.parametrize("use_git_timestamps", [False, True])
+def test_package_wdl_async_concurrent(use_git_timestamps):
+    expected_zip = tempfile.mktemp(".zip")
+    package_wdl(SIMPLE_WORKFLOW, expected_zip,
+                use_git_timestamps=use_git_timestamps, manifest_format="json",
+                index=True)
+    output_dir = Path(tempfile.mkdtemp())
+    test_zips = [str(output_dir / f"{number}.zip") for number in range(20)]
+
+    async def package_all():
+        git_semaphore = asyncio.Semaphore(4)
+        return await asyncio.gather(*(
+            package_wdl_async(SIMPLE_WORKFLOW, test_zip,
+                              use_git_timestamps=use_git_timestamps,
+                              manifest_format="json", index=True,
+                              git_semaphore=git_semaphore)
+            for test_zip in test_zips))
+
+    loop = asyncio.new_event_loop()
+    digests = loop.run_until_complete(package_all())
+    loop.close()
+    assert len({tuple(sorted(digest.items())) for digest in digests}) == 1
+    if use_git_timestamps:
+        # The zips are reproducible, so they must be the same as the zip
+        # created with package_wdl.
+        assert {file_md5sum(Path(test_zip)) for test_zip in test_zips} == {
+            file_md5sum(Path(expected_zip))}
+    for test_zip in test_zips:
+        with zipfile.ZipFile(test_zip, "r") as wdl_zip:
+            assert wdl_zip.testzip() is None
+        os.remove(test_zip)
+    os.rmdir(str(output_dir))
+    os.remove(expected_zip)
+
+
+def test_package_wdl_async_resolver_without_git_timestamps():
+    class FailingResolver(TimestampResolver):
+        async def timestamps_async(self, files, git_semaphore):
+            raise AssertionError("Git timestamps were not requested.")
+
+    test_zip = tempfile.mktemp(".zip")
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(package_wdl_async(
+        SIMPLE_WORKFLOW, test_zip, use_git_timestamps=False,
+        timestamp_resolver=FailingResolver()))
+    loop.close()
+    with zipfile.ZipFile(test_zip, "r") as wdl_zip:
+        assert wdl_zip.testzip() is None
+    os.remove(test_zip)
+
+
+def test_package_wdl_async_keeps_timezone(monkeypatch):
+    monkeypatch.setenv("TZ", "CET")
+    time.tzset()
+    async_zip = tempfile.mktemp(".zip")
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(package_wdl_async(
+        SIMPLE_WORKFLOW, async_zip, use_git_timestamps=True))
+    loop.close()
+    # The timezone of the process is not changed.
+    assert os.environ["TZ"] == "CET"
+    sync_zip = tempfile.mktemp(".zip")
+    package_wdl(SIMPLE_WORKFLOW, sync_zip, use_git_timestamps=True)
+    assert file_md5sum(Path(async_zip)) == file_md5sum(Path(sync_zip))
+    monkeypatch.undo()
+    time.tzset()
+    os.remove(async_zip)
+    os.remove(sync_zip)
+
+
+@pytest.mark.parametrize("steps", range(0, 40, 3))
+def test_package_wdl_async_cancel(steps):
+    output_dir = Path(tempfile.mkdtemp())
+    test_zip = output_dir / "test.zip"
+
+    async def cancel_after(steps):
+        task = asyncio.ensure_future(package_wdl_async(
+            SIMPLE_WORKFLOW, str(test_zip), use_git_timestamps=True))
+        for _ in range(steps):
+            await asyncio.sleep(0.001)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    loop = asyncio.new_event_loop()
+    cancelled = loop.run_until_complete(cancel_after(steps))
+    loop.close()
+    if cancelled:
+        # No partial output may be left behind.
+        assert list(output_dir.iterdir()) == []
+    else:
+        assert list(output_dir.iterdir()) == [test_zip]
+        test_zip.unlink()
+    os.rmdir(str(output_dir))